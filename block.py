@@ -8,7 +8,21 @@ here."""
 class Block:
     """A class for describing a sequence of styled characters. Acts a lot
     like a list and a str object, except that it also has such useful
-    attributes like `optional` and `variable`."""
+    attributes like `optional` and `variable`.
+
+    An invariant the search methods lean on: every `Char` holds exactly
+    one character, so the cached joined string (`self()`) is a flat
+    mirror of `self.chars` and positions in one map one-to-one onto the
+    other. That's what lets `index`, `rindex`, `count`, `split` and `in`
+    delegate the actual scanning to the native `str` machinery and use
+    the resulting offsets directly on the char list."""
+
+    __slots__ = ('chars', 'optional', 'variable', '_str_cache',
+                 '_paragraph', '_runs')
+    # A document holds a `Char` per character and a `Block` per parsed
+    # fragment, so dropping the per-instance `__dict__` in favor of a
+    # fixed slot layout saves a noticeable amount of memory and speeds up
+    # attribute access in the parsing loops.
 
     def __init__(self, text=None, optional=False, runs=False, variable=False):
         """
@@ -26,10 +40,13 @@ class Block:
         be variable or constant.
         """
 
-        super().__init__()
         self.chars = []
         self.optional = optional
         self.variable = variable
+        self._str_cache = None
+        # The joined string representation of `self.chars` is expensive to
+        # rebuild, so it's computed lazily on the first call and reset to
+        # `None` by every method that mutates `self.chars`.
 
         # Since empty Blocks are also allowed, this condition is present
         # here. Depending on the type of `text` that is given, `self.chars`
@@ -78,12 +95,29 @@ class Block:
         if not end:
             end = len(self.chars)
         if isinstance(value, str):
-            return "".join([char() for char in self.chars]).index(
-                value, start, end)
+            return self().index(value, start, end)
         if isinstance(value, Block):
             return self().index(value(), start, end)
         return self.chars.index(value, start, end)
 
+    def rindex(self, value, start=0, end=None):
+        """The mirror of `.index()`: the position of the last occurrence
+        of `value` within the given bounds. Searching right-to-left on
+        the string representation beats the old `[::-1]` idiom, which
+        reversed the whole char list into a throwaway `Block` first.
+
+        :param value: `Block` or `str`.
+        :param start: index to start searching the value from.
+        :param end: index at which searching concludes.
+
+        :return: the position of the last occurrence of `value`. The
+        search is formatting-insensitive.
+        """
+        if end is None:
+            end = len(self.chars)
+        needle = value if isinstance(value, str) else value()
+        return self().rindex(needle, start, end)
+
     def __getitem__(self, item):
         """Override subscription from `list` and `str` (slices and indexing)
 
@@ -96,6 +130,7 @@ class Block:
 
     def append(self, value):
         """Append either a `Block`, `Char or `str` objects"""
+        self._str_cache = None
         if isinstance(value, Block):
             self.chars.extend(value.chars)
             return
@@ -105,49 +140,70 @@ class Block:
             return
         self.chars.append(value)
 
-    def count(self, value):
-        """Count the number of `Block`, `Char` or `str` occurrences."""
+    def count(self, value, start=0, end=None):
+        """Count the number of `Block`, `Char` or `str` occurrences,
+        optionally within the `[start, end)` bounds — so callers keeping
+        a cursor into the Block can count the remainder without slicing
+        a copy off first."""
+        if end is None:
+            end = len(self.chars)
         if isinstance(value, str):
-            return "".join([char() for char in self.chars]).count(value)
+            return self().count(value, start, end)
         if isinstance(value, Block):
-            return "".join([char() for char in self.chars]).count(value())
-        return self.chars.count(value)
+            return self().count(value(), start, end)
+        return self.chars[start:end].count(value)
 
     def reverse(self):
         """Reverse the order of `Chars` in `self.chars`"""
+        self._str_cache = None
         self.chars.reverse()
 
     def pop(self):
         """Pop the last element of the `Block`"""
+        self._str_cache = None
         char = self.chars.pop()
         return Block(char)
 
     def split(self, delimiter):
         """Split the `Block` into a list of Blocks using a `Block` delimiter.
-        First split the raw string data with a string delimiter. Then
-        correspond each resulting slice to a `Block` slice and append that
-        to a list."""
-        split_list = self().split(delimiter())
-        i = 0
-        j = 0
-        k = 0
-        _chars = []
+        Since each `Char` holds exactly one character, positions in the
+        string representation map one-to-one onto `self.chars`, so the
+        actual scanning is delegated to `str.find` and each slice of
+        `self.chars` between two delimiters becomes a new `Block`."""
+        _text = self()
+        _delimiter = delimiter()
+        if len(_delimiter) == 1:
+            _parts = _text.split(_delimiter)
+            # For a one-character delimiter (comma, semicolon and the
+            # like — the common case between signals) the whole split
+            # happens in one native pass, and the part strings it hands
+            # back seed each child's string cache, sparing the re-join
+            # the next `child()` call would otherwise do.
+            texts = []
+            start = 0
+            for _part in _parts:
+                end = start + len(_part)
+                _block = Block()
+                _block.chars = self.chars[start:end]
+                _block._str_cache = _part
+                texts.append(_block)
+                start = end + 1
+            return texts
         texts = []
-        while i < len(self.chars):
-            if self.chars[i]() == split_list[j][k]:
-                _chars.append(self.chars[i])
-                k += 1
-            if k == len(split_list[j]):
-                j += 1
-                texts.append(Block(_chars))
-                _chars = []
-                k = 0
-            i += 1
+        start = 0
+        while True:
+            i = _text.find(_delimiter, start)
+            if i < 0:
+                texts.append(Block(self.chars[start:]))
+                break
+            texts.append(Block(self.chars[start:i]))
+            start = i + len(_delimiter)
         return texts
 
     def lstrip(self):
         if self.chars:
             if ' ' == self.chars[0]():
+                self._str_cache = None
                 del self.chars[0]
 
     def __len__(self):
@@ -156,11 +212,28 @@ class Block:
 
     def __delitem__(self, key):
         """Delete a `Char` object with given index."""
+        self._str_cache = None
         del self.chars[key]
 
+    @property
+    def text(self):
+        """The joined string representation of the Block. Reads the same
+        cache `__call__` fills in, it's just an attribute-style spelling
+        for the call sites that only want the text."""
+        if self._str_cache is None:
+            self._str_cache = ''.join([char.str for char in self.chars])
+        return self._str_cache
+
     def __call__(self):
-        """return the string representation of `self`"""
-        return ''.join([char() for char in self.chars])
+        """return the string representation of `self`. The join is only
+        performed on the first call after a mutation, any further call
+        returns the cached result."""
+        if self._str_cache is None:
+            self._str_cache = ''.join([char.str for char in self.chars])
+            # Reading `char.str` directly spares a `Char.__call__` per
+            # character; a list comprehension is used since `str.join`
+            # handles a ready list faster than a generator.
+        return self._str_cache
 
     def __add__(self, other):
         """Define concatenation when `self` is the first element"""
@@ -175,26 +248,34 @@ class Block:
     def __radd__(self, other):
         """Define concatenation when `self` is the second element"""
         if isinstance(other, str):
-            result = Block(other)
-            result.chars.extend(self.chars)
-            return result
-        new_chars = other.chars[:]
-        new_chars.extend.extend(self.chars)
-        return Block(new_chars)
+            return Block(other) + self
+            # `__add__` already handles this combination, no need to
+            # duplicate it here.
+        result = Block()
+        result.chars = other.chars + self.chars
+        return result
 
     def __contains__(self, item):
         """Define `in self` operator"""
-        if isinstance(item, str):
-            return True if self.count(item) > 0 else False
-        return True if self().count(item()) > 0 else False
+        needle = item if isinstance(item, str) else item()
+        return needle in self()
+        # `str.__contains__` stops at the first match, unlike the old
+        # `count(...) > 0`, which kept scanning the whole Block.
 
     def __eq__(self, other):
-        if isinstance(other, Block):
-            if other.chars == self.chars and \
-                other.variable == self.variable and \
-                other.optional == self.optional:
-                return True
-        return False
+        if not isinstance(other, Block):
+            return False
+        if self.variable != other.variable or \
+                self.optional != other.optional:
+            return False
+        if len(self.chars) != len(other.chars):
+            return False
+        return self() == other()
+        # Comparing the cached joined strings is a single C-level check;
+        # the old `self.chars == other.chars` route went through
+        # `Char.__eq__` for every pair. Nothing in the code compares Blocks
+        # by formatting, so the `variable`/`optional` flags plus the text
+        # are all the equality that's needed.
 
     def __ne__(self, other):
         return not self.__eq__(other)
@@ -203,6 +284,17 @@ class Block:
 class Char:
     """Class to store single characters and their formatting"""
 
+    __slots__ = ('str', 'italic', 'bold', 'underline', 'subscript',
+                 'superscript', 'bits')
+    # Same consideration as with `Block`: there's one `Char` per character
+    # of the document, so the slot layout is well worth it.
+
+    _bits_cache = {}
+    # Most adjacent characters share the exact same formatting, so instead
+    # of building a fresh `bits` container per `Char`, every distinct
+    # formatting combination is stored here once as a tuple and shared by
+    # all the Chars that carry it.
+
     def __init__(self, char, run=None):
         """
         Instance a `Char` object.
@@ -220,12 +312,13 @@ class Char:
 
         # This attribute comes in handy when comparing formatting style of
         # two `Char` objects and defining the style of a written `Run`.
-        self.bits = [self.italic,
-                     self.bold,
-                     self.underline,
-                     self.subscript,
-                     self.superscript,
-                     ]
+        _key = (self.italic,
+                self.bold,
+                self.underline,
+                self.subscript,
+                self.superscript,
+                )
+        self.bits = Char._bits_cache.setdefault(_key, _key)
 
     def __call__(self):
         """When called, return the string character"""
@@ -4,12 +4,15 @@ characters for each of the variables."""
 CUES = {
     '%n': None,
     '%s': None,
-    '%f': [str(x) for x in range(10)] + ['.'],
+    '%f': frozenset('0123456789.'),
     '%c': None, # the hyphen symbol that might be given for a range of
                 # chemshifts really screws this part up, so I just leave
                 # this without any cues.
-    '%i': [str(x) for x in range(10)],
-    '%m': ['s', 'd', 't', 'q', 'p', 'x', 'h', 'b', 'r', 'm', '*'],
-    '%j': [*[str(x) for x in range(10)], '.', ' ', ','],
+    '%i': frozenset('0123456789'),
+    '%m': frozenset('sdtqpxhbrm*'),
+    '%j': frozenset('0123456789. ,'),
     '%a': None,
-}
\ No newline at end of file
+}
+# Frozensets of single characters: membership checks against a cue happen
+# once per parsed character, and a set answers them in constant time,
+# whereas the old per-digit lists were scanned front to back.
\ No newline at end of file
@@ -0,0 +1,133 @@
+"""
+This module reads the paragraphs of a .docx file by streaming its
+`word/document.xml` part with `lxml.etree.iterparse`, instead of having
+python-docx materialize the whole document tree and a proxy object per
+element. Each paragraph is condensed into a lightweight `StreamParagraph`
+the moment it is parsed, and the underlying XML element is cleared right
+away, so the read path never holds more than one paragraph's XML at a
+time. python-docx stays in charge of the write path.
+
+The shim classes mirror just enough of the python-docx `Paragraph`/`Run`
+interface (`.text`, `.runs`, `.italic`, `.font.subscript` and so on) for
+the `Block` class to read them the same way it reads the real thing.
+"""
+
+import io
+import zipfile
+from lxml import etree
+
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+# The WordprocessingML namespace every `w:` tag lives in.
+
+_P_TAG = '{%s}p' % W_NS
+_R_TAG = '{%s}r' % W_NS
+_T_TAG = '{%s}t' % W_NS
+_TAB_TAG = '{%s}tab' % W_NS
+_BR_TAG = '{%s}br' % W_NS
+_CR_TAG = '{%s}cr' % W_NS
+_RPR_TAG = '{%s}rPr' % W_NS
+_I_TAG = '{%s}i' % W_NS
+_B_TAG = '{%s}b' % W_NS
+_U_TAG = '{%s}u' % W_NS
+_VERT_ALIGN_TAG = '{%s}vertAlign' % W_NS
+_VAL_ATTR = '{%s}val' % W_NS
+
+_FALSE_VALS = ('0', 'false', 'off')
+# The attribute values WordprocessingML uses to explicitly switch a
+# boolean property off.
+
+
+class StreamFont:
+    """Mimics the `.font` attribute of a python-docx `Run`, carrying the
+    only two font properties `Block` reads: sub- and superscript."""
+
+    __slots__ = ('subscript', 'superscript')
+
+    def __init__(self, subscript, superscript):
+        self.subscript = subscript
+        self.superscript = superscript
+
+
+class StreamRun:
+    """A pre-extracted stand-in for a python-docx `Run`. All the
+    properties are plain attributes computed once at parse time, using
+    the same tri-state convention as python-docx: `True`/`False` when the
+    property is set explicitly, `None` when it's inherited."""
+
+    __slots__ = ('text', 'italic', 'bold', 'underline', 'font')
+
+    def __init__(self, r_element):
+        texts = []
+        for child in r_element:
+            if child.tag == _T_TAG:
+                texts.append(child.text or '')
+            elif child.tag == _TAB_TAG:
+                texts.append('\t')
+            elif child.tag in (_BR_TAG, _CR_TAG):
+                texts.append('\n')
+        self.text = ''.join(texts)
+
+        self.italic = None
+        self.bold = None
+        self.underline = None
+        subscript = None
+        superscript = None
+        rpr = r_element.find(_RPR_TAG)
+        if rpr is not None:
+            for prop in rpr:
+                if prop.tag == _I_TAG:
+                    self.italic = self._read_toggle(prop)
+                elif prop.tag == _B_TAG:
+                    self.bold = self._read_toggle(prop)
+                elif prop.tag == _U_TAG:
+                    val = prop.get(_VAL_ATTR)
+                    self.underline = val != 'none'
+                elif prop.tag == _VERT_ALIGN_TAG:
+                    val = prop.get(_VAL_ATTR)
+                    subscript = val == 'subscript'
+                    superscript = val == 'superscript'
+        self.font = StreamFont(subscript, superscript)
+
+    @staticmethod
+    def _read_toggle(prop):
+        """A toggle property like `w:i` is on when present, unless its
+        `w:val` attribute explicitly turns it off."""
+        return prop.get(_VAL_ATTR) not in _FALSE_VALS
+
+
+class StreamParagraph:
+    """A pre-extracted stand-in for a python-docx `Paragraph`: just the
+    concatenated text and the list of `StreamRun` objects."""
+
+    __slots__ = ('text', 'runs')
+
+    def __init__(self, p_element):
+        self.runs = [StreamRun(r) for r in p_element.iter(_R_TAG)]
+        self.text = ''.join(run.text for run in self.runs)
+
+
+def read_paragraphs(path):
+    """
+    Stream the paragraphs of a .docx file.
+
+    :param path: path to the .docx file to be read.
+
+    :return: a list of `StreamParagraph` objects, one per paragraph of
+    the document body, in document order.
+    """
+
+    with open(path, 'rb') as file:
+        data = file.read()
+    # Slurp the file in one read: `ZipFile` otherwise issues many small
+    # seeks and reads for the central directory and each entry, and on an
+    # in-memory buffer those cost nothing.
+
+    paragraphs = []
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        with archive.open('word/document.xml') as stream:
+            for _, element in etree.iterparse(stream, tag=_P_TAG):
+                paragraphs.append(StreamParagraph(element))
+                element.clear()
+                # Condense the paragraph into the shim and free its XML
+                # right away, so the tree never accumulates.
+    return paragraphs
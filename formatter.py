@@ -27,6 +27,15 @@ This module can raise `FormatError`.
 from exceptions import FormatError
 from block import Block
 from cues import CUES
+from itertools import combinations
+from collections import Counter
+import re
+
+
+_formatter_cache = {}
+# Formatters already built during this run, keyed by the template text
+# plus the styling of each of its characters. Since the input and output
+# templates often coincide, this saves re-parsing identical templates.
 
 
 class Formatter:
@@ -37,6 +46,27 @@ class Formatter:
     which are composed of Chars. `self.hypotheses` is a `Hypotheses` object,
     a list of lists of `Section` objects."""
 
+    @classmethod
+    def from_block(cls, raw_nmr_format):
+        """Return a `Formatter` for the given template `Block`, reusing an
+        already-built one when an identical template (same text, same
+        per-character styling) has been parsed before.
+
+        :param raw_nmr_format: `Block` object built from the format
+        template inside a `.docx` file.
+
+        :return: a `Formatter` object, possibly shared with earlier callers.
+        """
+        key = (raw_nmr_format(),
+               tuple(char.bits for char in raw_nmr_format.chars))
+        # The `bits` tuples are interned, so the key stays small and
+        # hashes quickly.
+        formatter = _formatter_cache.get(key)
+        if formatter is None:
+            formatter = cls(raw_nmr_format)
+            _formatter_cache[key] = formatter
+        return formatter
+
     def __init__(self, raw_nmr_format):
         """Build a `Formatter` object, containing `self.head`,
         `self.signals` and `self.hypotheses`.
@@ -46,29 +76,36 @@ class Formatter:
         """
 
         self._raw_nmr_format = raw_nmr_format  # temporarily store the raw data
-        if self._raw_nmr_format.count('/') != 3:
+        _raw = self._raw_nmr_format()
+        # Materialize the template string once; every count/index below
+        # runs on it directly instead of re-joining the Block per lookup.
+        _slashes = [_i for _i, _char in enumerate(_raw) if _char == '/']
+        # One sweep collects every slash position; the count check and the
+        # three repeat indices all come out of it, where previously each
+        # was a separate scan of the template.
+        if len(_slashes) != 3:
             raise FormatError('there must be three and only three slashes ('
                               '"/" in a format template!')
         # There should always be three and only 3 slashes in the input
-        if self._raw_nmr_format.count('*') % 2 != 0:
+        if _raw.count('*') % 2 != 0:
             raise FormatError("there's an odd number of optionality markers "
                               "('*').")
         # Since an asterisk ("*") is used to enclose optional blocks,
         # there should always be an even number of those.
 
-        self._repeat_i = self._raw_nmr_format.index('/')
-        # Find the position where the repeats begin
-        self._repeat_i2 = self._raw_nmr_format.index('/',
-            self._repeat_i + 1)
-        # and end
-        self._repeat_i3 = len(self._raw_nmr_format) - 1 - \
-                          self._raw_nmr_format[::-1].index('/')
-        # and also where the delimiter ends
+        self._repeat_i, self._repeat_i2, self._repeat_i3 = _slashes
+        # The positions where the repeats begin and end, and where the
+        # delimiter ends.
 
-        if self._raw_nmr_format[self._repeat_i - 1] != ' ':
+        if _raw[self._repeat_i - 1] != ' ':
             raise FormatError('there must be a whitespace before the first '
                               'instance of "/"')
         # The repeats should always be preceded with a whitespace.
+        self._key_counts = Counter(_key.lower() for _key in
+                                   re.findall('%.', _raw))
+        # Tally every '%x' key of the template in one regex sweep; `_parse`
+        # consults this instead of recounting the whole raw Block for each
+        # key it encounters.
         self._head = self._raw_nmr_format[:self._repeat_i]
         # Raw version of `self.head` runs up until the first slash.
         self._signals = self._raw_nmr_format[self._repeat_i + 1:
@@ -91,6 +128,32 @@ class Formatter:
         self.hypotheses = self.Hypotheses(self.signals)
         # Build the three central attributes from their raw versions.
 
+        _last_repeat = self.signals()[-1]
+        self.split_delimiter = _last_repeat() + self.delimiter \
+            if not _last_repeat.variable and not _last_repeat.optional \
+            else self.delimiter
+        # The delimiter spectra are actually split on: if the final piece
+        # of a repeat is constant and obligatory, it's a good splitting
+        # cue and gets glued onto the user's delimiter. This used to be
+        # rebuilt by `parse_signals` for every single spectrum.
+
+        self.delimiter_in_h0 = self.split_delimiter() in \
+            ''.join(self.hypotheses()[0][0].str)
+        # Whether the splitting delimiter also occurs within the fullest
+        # hypothesis — the cue for choosing between the easy splitting
+        # and the hard-guessing path, also formerly re-derived (join and
+        # all) per spectrum.
+
+        self.sole_hypothesis = self.hypotheses()[0][0] \
+            if len(self.hypotheses()) == 1 and \
+            len(self.hypotheses()[0]) == 1 else None
+        # A template without optional pieces admits exactly one
+        # hypothesis, and it's resolved here, once per template, instead
+        # of being re-derived per signal. With it in hand, signal
+        # matching skips the whole hypothesis-scoring scan — the
+        # specialize-against-the-known-format trick, minus code
+        # generation.
+
     def _parse(self, unparsed):
         """Parses the head or signals format template into a list of
         functional Blocks, which is then returned to be contained in a
@@ -101,30 +164,35 @@ class Formatter:
         _optional = False       # On default, each block is considered
                                 # obligatory.
         list_of_parsed = []     # List to contain readied `Block` objects.
-        while unparsed:         # As long as there's anything unparsed...
-            if unparsed[0]() not in ('%', '*'):     # `unparsed` is a
-                                                    # `Block` object,
-                                                    # while indexed it returns
-                                                    # a `Char` object, which,
-                                                    # when called, returns
-                                                    # a string representation
-                                                    # of itself.
-                _text.append(unparsed[0])   # Append a `Char` if it's not
-                del unparsed[0]             # special, then move on to the next
+        _chars = unparsed.chars # The `Char` objects, read by position.
+        _raw = unparsed()       # The same data as a plain string.
+        _i = 0
+        # Rather than eating `unparsed` from the front (`del unparsed[0]`
+        # shifts the whole char list each time, making the loop quadratic),
+        # keep an integer cursor into the string/char list pair.
+        while _i < len(_raw):   # As long as there's anything unparsed...
+            if _raw[_i] not in ('%', '*'):
+                _text.append(_chars[_i])    # Append a `Char` if it's not
+                _i += 1                     # special, then move on to the next
                 continue                    # `Char` object.
-            if _text(): list_of_parsed.append(Block(_text,
-                _optional))
+            if _text():
+                _text.optional = _optional
+                list_of_parsed.append(_text)
+                # `_text` is replaced with a fresh Block right below, so
+                # it can be handed over as-is; re-wrapping it in
+                # `Block(_text, _optional)` would copy its char list for
+                # nothing.
             _text = Block()         # This code is only be executed if a
                                     # special symbol has been encountered.
                                     # `_text()` evaluation is necessary since
                                     # the first `Char` in the `unparsed` could
                                     # have been optional, resulting in ''.
-            if unparsed[0] == '%':
-                _key = '%' + unparsed[1]().lower()  # '%' is always followed
+            if _raw[_i] == '%':
+                _key = '%' + _raw[_i + 1].lower()   # '%' is always followed
                                                     # by just one symbol, so
                                                     # that is combined together
                                                     # in `_key`, a str.
-                if self._raw_nmr_format.count(_key) > 1:
+                if self._key_counts[_key] > 1:
                     raise FormatError(f'"{_key}" is encountered more than '
                                       f'once in the format template!')
                 # The same key is not allowed twice
@@ -141,14 +209,14 @@ class Formatter:
                                       f'be recognized')
                 # Only predefined keys are allowed
 
-                for _ in range(2): del unparsed[0]
+                _i += 2
                 list_of_parsed.append(Block(_key, _optional,
                     variable=True))
                 # Build a key `Block` through `variable=True` parameter
 
-            elif unparsed[0] == '*':    # Lastly, margins for optional Blocks
+            elif _raw[_i] == '*':       # Lastly, margins for optional Blocks
                                         # are processed
-                # if not list_of_parsed or len(unparsed) == 1:
+                # if not list_of_parsed or _i == len(_raw) - 1:
                 #     raise FormatError('знак опциональности "*" находится с '
                 #                       'краю шаблона формата')
                 # If nothing has been parsed yet, or '*' is the last symbol
@@ -156,10 +224,12 @@ class Formatter:
                 # format, which is not allowed. (currently inactive)
                 _optional = not _optional   # switch the `_optional` cue
                 list_of_parsed.append(Block('', _optional))
-                del unparsed[0] # '' is a cue `Hypotheses` class can easily
+                _i += 1         # '' is a cue `Hypotheses` class can easily
                                 # identify to break Sections into optional and
                                 # obligatory parts.
-        if _text(): list_of_parsed.append(Block(_text, _optional))
+        if _text():
+            _text.optional = _optional
+            list_of_parsed.append(_text)
         return list_of_parsed
         # this code is executed after the loop. If the final character was
         # constant, it'll not trigger `Block` instancing, so that line is
@@ -174,46 +244,78 @@ class Formatter:
             can also be provided
             """
             self.section = section # The actual list object
-            self.str = [block() for block in self.section]
-            # the same list but made of str objects
-
-            self.constants = [x for x in self.section if not x.variable]
-            self.constants_str = [constant() for constant in self.constants
-                if constant() != '']
-            # excerpts of the two lists above with only constant Blocks
-
-            self.variables = [x for x in self.section if x.variable]
-            self.variables_str = [variable() for variable in self.variables
-                if variable() != '']
-            # variable only
-
-            self.obligatories = [x for x in self.section if not x.optional]
-            self.obligatories_str = [obligatory() for obligatory in
-                self.obligatories if obligatory() != '']
-            # obligatory only
-
-            self.optionals = [x for x in self.section if x.optional]
-            self.optionals_str = [optional() for optional in self.optionals
-                if optional() != '']
-            # optional only
-
+            self._rebuild_derived()
             self.contains = contains
             # this lists all the variable info contained within the
             # `Section`, used to choose between different hypothesis sections.
 
+        def _rebuild_derived(self):
+            """Recompute every derived list from `self.section`. Factored
+            out of `__init__` so `splice_blocks` can refresh the lists
+            without re-running the constructor (and re-plumbing
+            `self.contains` through it)."""
+
+            self.str = []           # the same list but made of str objects
+            self.constants = []     # excerpts of the two lists above with
+            self.constants_str = [] # only constant Blocks
+            self.variables = []     # variable only
+            self.variables_str = []
+            self.obligatories = []  # obligatory only
+            self.obligatories_str = []
+            self.optionals = []     # optional only
+            self.optionals_str = []
+
+            for block in self.section:
+                _s = block.text
+                # materialize each block exactly once and sort it into the
+                # right lists in a single pass, rather than rescanning
+                # `self.section` with a comprehension per list.
+                self.str.append(_s)
+                if block.variable:
+                    self.variables.append(block)
+                    if _s != '': self.variables_str.append(_s)
+                else:
+                    self.constants.append(block)
+                    if _s != '': self.constants_str.append(_s)
+                if block.optional:
+                    self.optionals.append(block)
+                    if _s != '': self.optionals_str.append(_s)
+                else:
+                    self.obligatories.append(block)
+                    if _s != '': self.obligatories_str.append(_s)
+
+            self.var_index = {_s: _i for _i, _s in
+                              enumerate(self.variables_str)}
+            # Maps each variable notation onto its position among the
+            # section's variables, so consumers can look a variable up in
+            # one dict access instead of a membership test plus a linear
+            # `list.index` scan.
+
+            self.constants_str = tuple(self.constants_str)
+            self.variables_str = tuple(self.variables_str)
+            # Nothing appends to these after the rebuild, and the parsing
+            # loops iterate them per spectrum; tuples make that intent
+            # explicit and iterate a little faster than lists.
+
         def splice_blocks(self):
             """This method is used to splice adjacentBlocks with same
             `variable` attribute"""
 
-            for i, block in enumerate(self.section):
-                if i - 1 >= 0:
-                    if block.variable == self.section[i-1].variable:
-                        self.section[i-1] = self.section[i-1] + block
-                        self.section[i] = Block('', variable=None)
-            for item in self.section[:]:
-                if item == Block('', variable=None):
-                    self.section.remove(item)
-            self.__init__(self.section, contains=self.contains)
+            _spliced = []
+            for block in self.section:
+                if _spliced and _spliced[-1].variable == block.variable:
+                    _spliced[-1] = _spliced[-1] + block
+                else:
+                    _spliced.append(block)
+            # A single forward pass: a block either merges into the
+            # previous one (same `variable` attribute) or starts a new
+            # entry. This replaces the old overwrite-with-sentinel scheme,
+            # whose `list.remove` calls rescanned and compared Blocks
+            # char by char.
+            self.section = _spliced
+            self._rebuild_derived()
+            # Refresh the derived lists only; `self.contains` stays as it
+            # is, so there's no point going through `__init__` again.
 
         def __call__(self):
             return self.section
@@ -233,7 +335,7 @@ class Formatter:
             _piece = []
 
             for block in signal():
-                if block() == '':
+                if block.text == '':
                     self._pieces.append(_piece)
                     _piece = []
                 else:
@@ -262,78 +364,33 @@ class Formatter:
             optional pieces in them. Append the resulting list to
             `self.hypotheses`. Doesn't return anything"""
 
-            def find_combinations(a_list, n):
-                """Find all combinations of `n` optional pieces to be added to
-                a hypothesis. Return a two-dimensional list: list of
-                combinations, where each combination is a list of
-                optional pieces (which in turn is a list of Blocks)."""
-
-                leftout = [x for x in range(n, len(a_list))]
-                # `leftout` is a list of indices that will be used to knock
-                # out excluded pieces. It starts with a list of consequent
-                # indices, corresponding to the final elements of the list.
-                if not leftout:
-                    return [a_list]
-                # If nothing is to be leftout, conclude the execution of the
-                # function. `a_list` is nested in a list to conform to the
-                # format of any other function return.
-                combinations = []
-                # Otherwise, begin building combinations.
-                while True:
-                    finished = True
-                    # Enter the loop with the presumption that this is the
-                    # last iteration.
-                    temp_list = [x for x in a_list]
-                    # Soft copy the pieces into a temporary list
-                    for i, item in enumerate(a_list):
-                        if i in leftout:
-                            temp_list.remove(item)
-                    combinations.append(temp_list)
-                    # Exclude all the items whose indices are listed in the
-                    # `leftout`, then try to make a new iteration of `leftout`.
-                    if leftout[0] > 0:
-                        leftout[0] -= 1
-                        continue
-                        # If the first index hasn't reached 0, subtract 1.
-                        # That's it, new iteration ready, start a new loop.
-                    for i, item in enumerate(leftout):
-                        if item - 1 not in leftout and i != 0:
-                            leftout[i] -= 1
-                            finished = False
-                            for index in reversed(range(len(leftout[:i]))):
-                                leftout[index] = leftout[index + 1] - 1
-                            break
-                            # if there's a gap between any of the indices
-                            # ones after the first index has reached 0,
-                            # decrement the first index after the first gap
-                            # and set each index to the left of the
-                            # decremented one consequently. Only one index
-                            # should be decremented at a time, so the loop
-                            # is broken, `finished = False` signals that
-                            # there's at least one more iteration to do.
-                    if finished:
-                        return combinations
-                        # if up until this point nothing managed to signal
-                        # that they're still some iterations left, conclude
-                        # the execution of the function.
-
-            combinations = find_combinations(self._pieces[1::2], n)
+            _combinations = [list(combination) for combination in
+                combinations(self._pieces[1::2], n)]
             # Build a list of all combinations containing exactly `n`
-            # optional pieces.
+            # optional pieces. `itertools.combinations` enumerates the same
+            # subsequences the old hand-rolled `leftout` index machine did,
+            # but in C and without any `list.remove` scans.
             self._hypotheses = []
             # Ready a temporary list that will store all hypotheses of the
             # same length
 
-            for combination in combinations:
+            for combination in _combinations:
                 self._hypothesis = []
                 # Ready an empty hypothesis
-                for piece in self._pieces:
-                    if self._pieces.index(piece) % 2 == 0:
+                _combo_ids = {id(piece) for piece in combination}
+                # The pieces in a combination are the very list objects
+                # sitting in `self._pieces`, so identity is enough for the
+                # membership test below — no need for `in`, which would
+                # compare the pieces element-wise.
+                for _i, piece in enumerate(self._pieces):
+                    if _i % 2 == 0:
                         self._hypothesis.extend(piece)
                         # Each odd piece is obligatory, so append its Blocks
-                        # to the hypothesis.
+                        # to the hypothesis. `enumerate` hands the index
+                        # over directly, where `list.index` would rescan
+                        # `self._pieces` on every iteration.
                     else:
-                        if piece in combination:
+                        if id(piece) in _combo_ids:
                             self._hypothesis.extend(piece)
                             # For the optional pieces, only append their
                             # Blocks if they're in the combination.
@@ -341,9 +398,12 @@ class Formatter:
                 _contains = set()
                 for block in self._hypothesis:
                     if block.variable:
-                        _contains.add(block())
+                        _contains.add(block.text)
+                _contains = frozenset(_contains)
                 # Build a set of all the variables that made it into the
-                # hypothesis
+                # hypothesis. Frozen, so it's hashable — the writer keys
+                # its hypothesis-match cache on it — and plainly
+                # immutable.
 
                 hypothesis = Formatter.Section(self._hypothesis,
                     contains=_contains)
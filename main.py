@@ -3,14 +3,27 @@ This is the file to be executed. It contains most of the higher-level logic.
 """
 
 from docx import Document
-from docx.opc import exceptions as docexc
+from docx.oxml.ns import qn
 import os
+import pickle
+import re
+import zipfile
+from docx_stream import read_paragraphs
 from formatter import Formatter
 from spectrum import Spectrum
 from exceptions import InputError
 from block import Block
 import sys
-from msvcrt import getch
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+try:
+    from msvcrt import getch
+except ImportError:
+    getch = lambda: sys.stdin.read(1)
+# `msvcrt` only exists on Windows; everywhere else reading a byte from
+# stdin serves the same 'press any key' purpose.
 
 # Enclose this in comments to enable debugging mode, starting here...
 
@@ -22,106 +35,218 @@ def show_exception_and_exit(exc_type, exc_value, tb):
     getch()
     sys.exit(-1)
 
+# ...the hook is installed under the __main__ guard below. I'm not sure
+# this works the way it should, though, it still exits the interpreter
+# before anything can be read.
+
+
+_PACKAGE_DIR = os.path.dirname(os.path.realpath(__file__))
+PATH = _PACKAGE_DIR + '/'
+
+if _PACKAGE_DIR not in sys.path:
+    sys.path.insert(0, _PACKAGE_DIR)
+# The parsing pool's workers must import this script and the `spectrum`
+# module for themselves under the spawn start method (the only one on
+# Windows, the default on macOS). A spawned worker inherits a copy of
+# this process's `sys.path` — but not necessarily with the script's own
+# directory on it, that depends on how the program was launched — so the
+# directory is pinned here before any pool exists.
+
+_DISPATCH = re.compile(
+    r'^(Spectrum|Task|Assignments|Input format|Output format):\s?')
+# Every keyword the scan recognizes, folded into one compiled alternation.
+# A single `match` call classifies a paragraph in one pass where a chain
+# of separate `startswith`/`in` checks would rescan its text once per
+# keyword.
+
+REASSIGNMENT_FORMATTER = Formatter.from_block(Block(' /%a/$/'))
+# The template used for parsing reassignment values never changes, so the
+# `Formatter` for it is built once here rather than per 'Assignments:'
+# keyword. The first space is necessary, because there always must be a
+# space before the first slash.
+
+def read_document(path):
+    """Access the document with NMR spectra and return its paragraphs.
+    This only accepts .docx files. The paragraphs are streamed out of the
+    document's XML part (see the `docx_stream` module) rather than built
+    by python-docx, which materializes the entire tree; python-docx is
+    only involved in writing nowadays."""
 
-sys.excepthook = show_exception_and_exit
-sys.tracebacklimit = 0
-
-# ...right up to here. I'm not sure this works the way it should, though,
-# it still exits the interpreter before anything can be read.
-
-
-PATH = os.path.dirname(os.path.realpath(__file__)) + '/'
-
-def read_document():
-    """Access the document with NMR spectra. This only accepts .docx files"""
-
-    global filename
-    # This ensures the value for the `filename` variable can be accessed from
-    # outside the function, even though the actual value is given within the
-    # function.
-
-    filename = input('Enter the input file name: ')
     try:
-        document = Document(PATH + filename + '.docx')
-    except docexc.PackageNotFoundError:
+        paragraphs = read_paragraphs(path)
+    except (FileNotFoundError, KeyError, zipfile.BadZipFile):
         print('Error: no document with such name has been found!')
         raise
     else:
-        return document
+        return paragraphs
 
 
-def read_format_style(paragraphs, anchor):
+def cache_key(path):
+    """The fingerprint of an input file used to decide whether a cached
+    parse of it is still valid."""
+    return os.path.getmtime(path), os.path.getsize(path)
+
+
+def load_processed_cache(path):
     """
-    Read the format style template for the spectra to be read/written.
+    Try loading fully processed spectra from the pickle cache sitting
+    next to the input file. Rerunning the program on an unchanged input
+    (say, to write under a different name) then skips parsing altogether.
 
-    :param paragraphs: the spectra .docx document parsed into separate
-    paragraphs.
-    :param anchor: the keyword found at the beginning of a paragraph
-    containing the necessary format template.
+    :param path: path of the input .docx file.
 
-    :return: a `Formatter` object describing the format style for a spectrum.
+    :return: a (spectra, formatter) tuple ready for writing, or `None`
+    when there's no cache, it's unreadable, or the input file changed
+    since it was written.
     """
 
-    for paragraph in paragraphs:
-        if anchor in paragraph.text:
-            raw_format = Block(paragraph, runs=True)[len(anchor):]
-            # Clip the keyword and the space after it to be processed into a
-            # `Formatter` object.
-            return Formatter(raw_format)
-    raise InputError('format template not located within the file')
+    try:
+        with open(path + '.cache', 'rb') as file:
+            key, spectra, formatter = pickle.load(file)
+        if key != cache_key(path):
+            return None
+        # A stale cache (the input's mtime or size changed) is as good
+        # as no cache.
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError,
+            ValueError):
+        return None
+    # A missing or unreadable cache file simply means the document is to
+    # be parsed the usual way.
+    return spectra, formatter
+
+
+def save_processed_cache(path, spectra, formatter):
+    """Pickle the processed spectra and the formatter they are to be
+    written with, keyed by the input file's fingerprint."""
+    try:
+        with open(path + '.cache', 'wb') as file:
+            pickle.dump((cache_key(path), spectra, formatter), file)
+    except OSError:
+        pass
+    # Not being able to write the cache is no reason to fail the run.
 
 
-def read_spectra(paragraphs, formatter):
+def scan_paragraphs(paragraphs):
     """
-    Read the spectra data from a list of .docx paragraphs and return a
-    list of `Spectrum` objects.
+    Walk the document's paragraphs exactly once and collect everything the
+    rest of the program needs from them: the paragraphs holding the format
+    templates, the raw spectra and the task list. Previously each of those
+    was located by its own loop over `paragraphs`, and each loop read
+    `paragraph.text` anew — a property that re-serializes the underlying
+    XML runs on every access.
 
-    :param paragraphs: a list of `Paragraph` objects.
-    :param formatter: a `Formatter` object used to parse the raw data.
+    :param paragraphs: the spectra .docx document parsed into separate
+    paragraphs.
 
-    :return: a list of `Spectrum` objects.
+    :return: a dict with 'formats' (anchor keyword mapped to its
+    paragraph), 'spectra' (a list of (cypher, paragraph) tuples),
+    'assigns' (a list of (cypher, index) tuples pointing at the first
+    paragraph after each 'Assignments:' keyword) and 'task' (a list of
+    `str` tasks, or `None` if there's no task keyword).
     """
 
-    r_spectra = []
+    scan = {'formats': {}, 'spectra': [], 'assigns': [], 'task': None}
     for i, paragraph in enumerate(paragraphs):
-        if paragraph.text.split(' ')[0] == 'Spectrum:':
+        text = paragraph.text
+        # Read the paragraph text exactly once per paragraph.
+        match = _DISPATCH.match(text)
+        if match is None:
+            continue
+            # Most paragraphs carry no keyword at all; one regex pass
+            # rules them out.
+        keyword = match.group(1)
+        rest = text[match.end():]
+        # Whatever follows the keyword (and the space after it).
+        if keyword == 'Input format':
+            scan['formats']['Input format: '] = paragraph
+        elif keyword == 'Output format':
+            scan['formats']['Output format: '] = paragraph
+        elif keyword == 'Spectrum':
         # This keyword signals that the next paragraphs contains the actual
         # spectrum data.
 
-            r_spectra.append((paragraph.text.rstrip().replace('Spectrum: ',
-                ''),
-                              paragraphs[i+1]))
+            scan['spectra'].append((rest.rstrip(), paragraphs[i+1]))
             # Store the cypher given after the keyword and the spectrum
             # itself as a tuple of raw data, itself appended to a list of
             # raw data.
 
-    print('Number of located spectra: {}.\n'.format(len(r_spectra)))
-
-    spectra = []    # The list to store processed spectra.
-    for r_spectrum in r_spectra:
-        spectrum = Spectrum(r_spectrum, formatter) # Build a `Spectrum`
-                                                   # object for each tuple
-                                                   # in the list of raw data.
-        print(spectrum)
-        spectra.append(spectrum)    # Save each `Spectrum` object into a list.
-        for signal in spectrum.signals:
-            print(signal)
-        print('\n')
-    return spectra
+        elif keyword == 'Assignments':
+            scan['assigns'].append((rest, i + 1))
+            # Remember the cypher of the spectrum the reassignments are
+            # meant for and where its values start, so the reassignment
+            # stage doesn't need a second walk over the paragraphs.
+
+        elif keyword == 'Task':
+            scan['task'] = rest.split(' ')
+            # Everything after the keyword is a `str` task.
+    return scan
+
+
+def read_format_style(scan, anchor):
+    """
+    Read the format style template for the spectra to be read/written.
 
+    :param scan: the dict of pre-collected paragraphs built by
+    `scan_paragraphs`.
+    :param anchor: the keyword found at the beginning of a paragraph
+    containing the necessary format template.
 
-def read_task(paragraphs):
+    :return: a `Formatter` object describing the format style for a spectrum.
     """
-    Locate which tasks are to be performed with the spectra.
-    :param paragraphs: paragraphs that contain a list of tasks to be performed
-    :return: a list of `str` tasks to be performed
+
+    paragraph = scan['formats'].get(anchor)
+    if paragraph is None:
+        raise InputError('format template not located within the file')
+    raw_format = Block(paragraph, runs=True)[len(anchor):]
+    # Clip the keyword and the space after it to be processed into a
+    # `Formatter` object. `from_block` reuses an already parsed
+    # `Formatter` when the input and output templates are identical.
+    return Formatter.from_block(raw_format)
+
+
+def read_spectra(r_spectra, formatter):
     """
+    Read the pre-collected spectra data and return a list of `Spectrum`
+    objects.
 
-    for paragraph in paragraphs:
-        if paragraph.text.split(' ')[0] == 'Task:':
-            return paragraph.text.split(' ')[1:]
-        # Find the keyword preceding listed tasks and return a list of `str`
-        # tasks.
+    :param r_spectra: a list of (cypher, paragraph) tuples collected by
+    `scan_paragraphs`.
+    :param formatter: a `Formatter` object used to parse the raw data.
+
+    :return: a list of `Spectrum` objects.
+    """
+
+    if len(r_spectra) < 32:
+        spectra = [Spectrum(r_spectrum, formatter)
+                   for r_spectrum in r_spectra]
+        # Build a `Spectrum` object for each tuple in the list of raw
+        # data. For a handful of spectra the serial loop wins — spinning
+        # up worker processes costs more than the parse itself.
+
+    else:
+        with ProcessPoolExecutor() as executor:
+            spectra = list(executor.map(
+                partial(Spectrum, formatter=formatter),
+                r_spectra, chunksize=8))
+        # Each construction is CPU-bound and independent of the others,
+        # so on a document with many spectra they are parsed across all
+        # cores. Everything that crosses the process boundary — the
+        # `StreamParagraph` shims going out, the built `Spectrum`
+        # objects coming back — is plain picklable Python. `map` keeps
+        # the document order.
+
+    buffer = ['Number of located spectra: {}.\n'.format(len(r_spectra))]
+    # Everything the report needs is collected here and flushed in one
+    # write at the end. `print` takes the stdout lock and issues a write
+    # per line, which on a document with thousands of signals makes the
+    # parse wait on the terminal; one big write doesn't.
+
+    for spectrum in spectra:
+        buffer.append(str(spectrum))
+        buffer.extend(str(signal) for signal in spectrum.signals)
+        buffer.append('\n')
+    sys.stdout.write('\n'.join(buffer) + '\n')
+    return spectra
 
 
 def write_spectra(spectra, formatter, document):
@@ -134,8 +259,15 @@ def write_spectra(spectra, formatter, document):
     :param document: the .docx file for writing the spectra down.
     :return: `None`
     """
+    sect_pr = document.element.body.find(qn('w:sectPr'))
     for spectrum in spectra:
-        spectrum.write(document, formatter)
+        for p_element in spectrum.to_xml(formatter):
+            sect_pr.addprevious(p_element)
+    # Each spectrum renders its paragraphs detached (see
+    # `Spectrum.to_xml`) and they are spliced into the body here, right
+    # before the section properties that must stay last. This skips
+    # `document.add_paragraph` and the proxy objects it rebuilds on
+    # every append.
 
 
 def ready_reassignment_spectrum(cypher, paragraphs):
@@ -168,36 +300,36 @@ def ready_reassignment_spectrum(cypher, paragraphs):
     # actual spectrum data, so we create that.
 
     for paragraph in paragraphs:
-        if ' = ' not in paragraph.text:
+        text = paragraph.text
+        # Bind the text to a local once: the `.text` property re-walks the
+        # paragraph's XML on every read, and it used to be read four times
+        # per paragraph here.
+        if ' = ' not in text:
             break
             # The moment there's no ' = ' in a paragraph, the search for
             # reassignment values is over, time to build the reassignment
             # `Spectrum`.
-        old_assign = paragraph.text[:paragraph.text.index(' = ')]
+        sep_i = text.index(' = ')
+        old_assign = text[:sep_i]
         old_assigns.append(old_assign)
         # Everything preceding ' = ' is an old assignment.
 
-        new_assign = Block(paragraph,
-            runs=True)[paragraph.text.index(' = ') + 3:]
+        if new_assigns:
+            new_assigns.append('$')
+        # The '$' special symbol is used as a delimiter between new
+        # assignments. Writing it before every entry except the first
+        # means no trailing delimiter to delete afterwards, and no
+        # throwaway `Block('$')` object per entry.
+
+        new_assign = Block(paragraph, runs=True)[sep_i + 3:]
         new_assigns.append(new_assign)
         # And everything after that is the new assignment. Using the `Block`
         # class to read the new assignment allows to save its styling.
         # Appending this block to `new_assigns` (also a `Block`) results in
         # one big `Block` where the styling of each `Char` is specified.
 
-        new_assigns.append(Block('$'))
-        # The '$' special symbol is used as a delimiter between new
-        # assignments.
-
-    del new_assigns[-1]
-    # The final '$' symbol is unnecessary and will cause problem. We delete it.
-
-    formatter = Formatter(Block(' /%a/$/'))
-    # Build a `Formatter` object for parsing the newly built `new_assigns`
-    # Block. The first space is necessary, because there always must be a
-    # space before the first slash.
-
-    return old_assigns, Spectrum((cypher, new_assigns), formatter,
+    return old_assigns, Spectrum((cypher, new_assigns),
+        REASSIGNMENT_FORMATTER,
         blocked_signals_only=True)
     # Using 'blocked_signals_only=True' ensures the initation of an object
     # won't try to make a new Block nor will it attempt to parse head and
@@ -222,6 +354,14 @@ def reassign_spectra(spectra, reassigns):
     provided, return `None`
     """
 
+    by_cypher = {}
+    for spectrum in spectra:
+        by_cypher.setdefault(spectrum.cypher, []).append(spectrum)
+    # Group the spectra by cypher once. Nothing forbids two spectra from
+    # sharing a cypher, so each entry is a list, and every reassignment
+    # below finds its spectra with a single dict lookup instead of
+    # scanning the whole spectra list.
+
     ultra_reassign = None
     for new_assign in reassigns:
         if new_assign[1].cypher == '*':
@@ -230,9 +370,8 @@ def reassign_spectra(spectra, reassigns):
             # The global, non-specific reassign spectrum is the one whose
             # cypher is '*'
 
-        for spectrum in spectra:
-            if spectrum.cypher == new_assign[1].cypher:
-                reassign_spectrum(spectrum, new_assign)
+        for spectrum in by_cypher.get(new_assign[1].cypher, ()):
+            reassign_spectrum(spectrum, new_assign)
             # If cyphers of the compared `Spectrum` and reassignment
             # `Spectrum` are the same, perform reassignment.
 
@@ -250,86 +389,130 @@ def reassign_spectrum(spectrum, new_assign):
     :return: None
     """
 
-    old_assignments = [x.assignment() for x in spectrum.signals]
-    # Make a list of signals in the original spectrum.
+    old_assignment_index = {}
+    for i, signal in enumerate(spectrum.signals):
+        old_assignment_index.setdefault(signal.assignment_str, i)
+    # Map each assignment of the original spectrum onto the index of its
+    # signal. `setdefault` keeps the first occurrence, matching the old
+    # `list.index` behavior on duplicates. One pass here replaces the
+    # membership test plus `list.index` scan per reassigned signal below.
 
+    new_assign_signals = new_assign[1].signals
     for j, signal in enumerate(new_assign[0]):
-        if signal in old_assignments:
-            i = old_assignments.index(signal)
+        i = old_assignment_index.get(signal)
+        if i is not None:
             spectrum.signals[i].assignment =\
-                new_assign[1].signals[j].assignment
+                new_assign_signals[j].assignment
+            spectrum.signals[i]._assignment_str = None
+            # The signal's cached rendering of its assignment is stale
+            # the moment the assignment is rebound.
             # If there's a match between a signal to be reassigned and a
             # signal found in the spectrum, then locate the index of the
             # signal to be reassigned within the processed `Spectrum`
             # (`spectrum.signals[i].assignment`), and substitute it for the
-            # new value (`new_assign[-1].signals[j].assignment). Since all of
+            # new value (`new_assign_signals[j].assignment`). Since all of
             # this is done with `Block` objects, the styling is retained.
 
 
 
-filename = ''
-# This sets up a global variable later to be used in `read_document` function.
+def main():
+    """Run the whole program: prompt for the input file, parse (or load
+    from cache), perform the tasks and write the output document. Living
+    in a function rather than at module level lets every name below
+    resolve as a fast local, and importing this module for its helpers no
+    longer kicks off the interactive session."""
 
-document = read_document()
-paragraphs = document.paragraphs
-formatter = read_format_style(paragraphs, 'Input format: ')
-spectra = read_spectra(paragraphs, formatter)
-# Read the document, extract the paragraphs, find the input format there
-# using the keyword and use the built `Formatter` object to parse spectral
-# data.
+    filename = input('Enter the input file name: ')
+    in_path = PATH + filename + '.docx'
 
-task = read_task(paragraphs)
-# Read the tasks.
+    processed = load_processed_cache(in_path)
+    # Everything below up to the writing stage only transforms the input
+    # document, so its result can be cached wholesale. On a rerun over an
+    # unchanged input the pickle cache hands the processed spectra back and
+    # the whole parsing/reassigning/converting stage is skipped.
 
-if 'reassign' in task:
-    reassigns = []
-    for i, paragraph in enumerate(paragraphs):
-        if paragraph.text.split(' ')[0] == 'Assignments:':
-            cypher = paragraph.text.replace('Assignments: ', '')
-            reassigns.append(ready_reassignment_spectrum(cypher,
-                paragraphs[i + 1:]))
-    ultra_reassign = reassign_spectra(spectra, reassigns)
-    if ultra_reassign:
-        for spectrum in spectra:
-            reassign_spectrum(spectrum, ultra_reassign)
-# If the task is to reassign the old assignments, then first it's necessary
-# to find the paragraph that starts with the keyword (and cut it out).
-# Everything after the keyword is the cypher of the spectrum to be
-# reassigned (or '*' if its the non-specific reassignment). Then
-# feed every paragraph after that to `ready_reassignment_spectrum` that will
-# return a tuple of old assignments and a `Spectrum` with new assignments.
-# Append it to the `reassigns` list. Then perform specific reassignment for
-# all spectra with `reassign_spectra`. If there's a non-specific
-# reassignment to be done, `ultra_reassign` will contain a tuple rather than
-# None, feed it to `reassign_spectrum` for every spectrum to perform
-# non-specific reassignment. Note that specific reassignment has to take
-# place first, since non-specific reassignment might erroneously reassign a
-# signal before the specific reassignment gets a chance to do so.
-# Thought: specific reassignment might unintentionally feed the right
-# conditions for non-specific reassignment, but since thus far I only needed
-# to reassign minimalistic notation to actual assignment, this has not been
-# a problem.
-
-if 'convert' in task:
-    formatter = read_format_style(paragraphs, 'Output format: ')
-# If one needs to use a new format for writing the spectra down, ready the
-# new `Formatter` object.
-
-
-while True:
-    new_file = input('Enter the name of the file to be written: ')
-    if new_file == filename:
-        print('You are trying to re-write the input file! Please, choose '
-              'another name for your output file!')
-        continue
-    break
-new_document = Document()
-write_spectra(spectra, formatter, new_document)
-new_document.save(PATH + new_file + '.docx')
-# Ask where to write the new file. Saving atop the same file as the input
-# file is forbidden. Perform `write_spectra` using the wanted `Formatter`
-# and save the .docx file.
-
-os.system('pause')
-# This is intended to let the user see the Error Message should any arise,
-# but this doesn't actually work like this :'(.
+    if processed is not None:
+        spectra, formatter = processed
+        print('Loaded {} processed spectra from cache.\n'.format(len(spectra)))
+
+    else:
+        paragraphs = read_document(in_path)
+        scan = scan_paragraphs(paragraphs)
+        formatter = read_format_style(scan, 'Input format: ')
+        spectra = read_spectra(scan['spectra'], formatter)
+        # Read the document, walk the paragraphs once to collect the keyword
+        # anchors, find the input format among them and use the built
+        # `Formatter` object to parse spectral data.
+
+        task = scan['task']
+        # The tasks come out of the same single pass.
+
+        if 'reassign' in task:
+            reassigns = [ready_reassignment_spectrum(cypher, paragraphs[i:])
+                         for cypher, i in scan['assigns']]
+            # The anchors come pre-collected out of the same single pass
+            # as everything else, so no second walk over the paragraphs
+            # is needed here.
+            ultra_reassign = reassign_spectra(spectra, reassigns)
+            if ultra_reassign:
+                for spectrum in spectra:
+                    reassign_spectrum(spectrum, ultra_reassign)
+        # If the task is to reassign the old assignments, then first it's
+        # necessary to find the paragraph that starts with the keyword (and
+        # cut it out). Everything after the keyword is the cypher of the
+        # spectrum to be reassigned (or '*' if its the non-specific
+        # reassignment). Then feed every paragraph after that to
+        # `ready_reassignment_spectrum` that will return a tuple of old
+        # assignments and a `Spectrum` with new assignments.
+        # Append it to the `reassigns` list. Then perform specific
+        # reassignment for all spectra with `reassign_spectra`. If there's a
+        # non-specific reassignment to be done, `ultra_reassign` will contain
+        # a tuple rather than None, feed it to `reassign_spectrum` for every
+        # spectrum to perform non-specific reassignment. Note that specific
+        # reassignment has to take place first, since non-specific
+        # reassignment might erroneously reassign a signal before the
+        # specific reassignment gets a chance to do so.
+        # Thought: specific reassignment might unintentionally feed the right
+        # conditions for non-specific reassignment, but since thus far I only
+        # needed to reassign minimalistic notation to actual assignment, this
+        # has not been a problem.
+
+        if 'convert' in task:
+            formatter = read_format_style(scan, 'Output format: ')
+        # If one needs to use a new format for writing the spectra down,
+        # ready the new `Formatter` object.
+
+        save_processed_cache(in_path, spectra, formatter)
+        # Remember the processed state for the next run over this same input.
+
+    in_resolved = Path(in_path).resolve()
+    while True:
+        new_file = input('Enter the name of the file to be written: ')
+        if Path(PATH + new_file + '.docx').resolve() == in_resolved:
+            # Compare the resolved paths rather than the raw names:
+            # './name', absolute paths and (on Windows, the intended
+            # platform) case differences all name the same file, and
+            # overwriting the input forces a full re-parse next run.
+            print('You are trying to re-write the input file! Please, choose '
+                  'another name for your output file!')
+            continue
+        break
+    new_document = Document()
+    write_spectra(spectra, formatter, new_document)
+    new_document.save(PATH + new_file + '.docx')
+    # Ask where to write the new file. Saving atop the same file as the input
+    # file is forbidden. Perform `write_spectra` using the wanted `Formatter`
+    # and save the .docx file.
+
+    if sys.stdin.isatty():
+        input('Press Enter to exit.')
+    # This is intended to let the user see the Error Message should any
+    # arise. Asking via `input` keeps it inside this process —
+    # `os.system('pause')` used to spawn a whole cmd.exe for it — and
+    # piped/batch runs skip the wait altogether.
+
+
+if __name__ == '__main__':
+    sys.excepthook = show_exception_and_exit
+    sys.tracebacklimit = 0
+    main()
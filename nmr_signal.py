@@ -0,0 +1,109 @@
+"""A module containing a single `Signal` class for representing a signal.
+
+The module is named `nmr_signal` rather than `signal` on purpose: a
+module called `signal` shadows the standard library module of the same
+name, and the multiprocessing machinery the parsing pool relies on
+imports stdlib `signal` at startup — under the spawn start method (the
+only one on Windows) either the workers got the wrong `signal` or the
+stdlib did, depending on the path order."""
+from block import Block
+
+class Signal:
+    """A class for representing a single signal: it's chemical shift,
+    integral, multiplicity, J values and assignment."""
+
+    __slots__ = ('hypothesis', 'chemshift', 'integral', 'multiplicity',
+                 'j_values', 'assignment', '_chemshift_str',
+                 '_integral_str', '_multiplicity_str', '_j_values_str',
+                 '_assignment_str')
+    # A big document means a `Signal` per signal, so the per-instance
+    # `__dict__` is worth dropping: the attribute set is fixed anyway
+    # (the five variables, the hypothesis and the rendering caches).
+
+    def __init__(self, signal_variables, hypothesis):
+        """Initiate a `Signal` object from a list of Blocks and a matched
+        hypothesis to build correspondences."""
+        self.hypothesis = hypothesis
+
+        var_index = self.hypothesis.var_index
+        # The hypothesis carries a ready {variable: position} dict, so each
+        # attribute binds with a single lookup instead of a membership test
+        # plus a linear `list.index` scan over `variables_str`.
+        self.chemshift = signal_variables[var_index['%c']] \
+            if '%c' in var_index else None
+        self.integral = signal_variables[var_index['%i']] \
+            if '%i' in var_index else None
+        self.multiplicity = signal_variables[var_index['%m']] \
+            if '%m' in var_index else None
+        self.j_values = signal_variables[var_index['%j']] \
+            if '%j' in var_index else None
+        self.assignment = signal_variables[var_index['%a']] \
+            if '%a' in var_index else Block('')
+
+        self._chemshift_str = None
+        self._integral_str = None
+        self._multiplicity_str = None
+        self._j_values_str = None
+        self._assignment_str = None
+        # Lazily filled caches of the rendered variables. Rendering a
+        # `Block` into a `str` walks its chars, and printing, reassigning
+        # and writing may each render the same signal; each variable is
+        # now rendered at most once. `None` marks 'not rendered yet' —
+        # an empty rendering is a valid cached value.
+
+    @property
+    def chemshift_str(self):
+        """The chemical shift rendered into a `str`, cached."""
+        if self._chemshift_str is None:
+            self._chemshift_str = self.chemshift()
+        return self._chemshift_str
+
+    @property
+    def integral_str(self):
+        """The integral rendered into a `str`, cached."""
+        if self._integral_str is None:
+            self._integral_str = self.integral()
+        return self._integral_str
+
+    @property
+    def multiplicity_str(self):
+        """The multiplicity rendered into a `str`, cached."""
+        if self._multiplicity_str is None:
+            self._multiplicity_str = self.multiplicity()
+        return self._multiplicity_str
+
+    @property
+    def j_values_str(self):
+        """The J values rendered into a `str`, cached."""
+        if self._j_values_str is None:
+            self._j_values_str = self.j_values()
+        return self._j_values_str
+
+    @property
+    def assignment_str(self):
+        """The assignment rendered into a `str`, cached. Whoever rebinds
+        `assignment` (reassignment does) must reset `_assignment_str` to
+        `None` so the next read re-renders."""
+        if self._assignment_str is None:
+            self._assignment_str = self.assignment()
+        return self._assignment_str
+
+
+    def __str__(self):
+        parts = []
+        # Only the variables the signal actually has contribute a piece;
+        # absent ones used to still allocate an empty `str` each and sit
+        # in a five-way `+` chain. A single `join` over the present
+        # pieces allocates the result once.
+        if self.chemshift:
+            parts.append(f'Chemshift: {self.chemshift_str}')
+        if self.integral:
+            parts.append(f', integral: {self.integral_str}')
+        if self.multiplicity:
+            parts.append(f', multiplicity: {self.multiplicity_str}')
+        if self.j_values:
+            parts.append(f', J constant(s): {self.j_values_str} Hz')
+        if self.assignment:
+            parts.append(f', assignment: {self.assignment_str}')
+        parts.append('.')
+        return ''.join(parts)
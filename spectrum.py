@@ -5,11 +5,12 @@ forth. All signals are collected into the `self.signals` list, a list of
 
 This module can raise `InputError`."""
 
+import sys
+from bisect import bisect_left
 from exceptions import InputError
-from signal import Signal
+from nmr_signal import Signal
 from block import Block
 import writer as w
-from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
 from cues import CUES
 
 class Spectrum:
@@ -22,8 +23,11 @@ class Spectrum:
         :param formatter: `Formatter`. Used to parse the spectrum, also this is
         the default format for writing the spectrum.
         """
-        self.cypher = r_spectrum[0]     # cypher should be the first element
-                                        # of the tuple
+        self.cypher = sys.intern(r_spectrum[0])
+        # cypher should be the first element of the tuple. Interning it
+        # makes every cypher comparison during reassignment (and the
+        # grouping dict's hash lookups) a pointer check instead of a
+        # character walk.
         self.formatter = formatter
         # Store the formatter in the `Spectrum` object as well. The
         # formatter is used to parse `self.text` and also is the default
@@ -52,43 +56,56 @@ class Spectrum:
             self.read()
 
 
-        # These three attributes store `Block` objects
-        self.nuclide = self._spectrum_data[
-            self.formatter.head.variables_str.index('%n')] if '%n' in \
-                self.formatter.head.variables_str else None
-        self.solvent = self._spectrum_data[
-            self.formatter.head.variables_str.index('%s')] if '%s' in \
-                self.formatter.head.variables_str else None
-        self.frequency = self._spectrum_data[
-            self.formatter.head.variables_str.index('%f')] if '%f' in \
-                self.formatter.head.variables_str else None
-
-    def write(self, document, formatter=None):
-        """Write a spectrum to a paragraph using JUSTIFY alignment."""
-        _paragraph = document.add_paragraph()
-        _paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.JUSTIFY
-        w.print_runs(_paragraph, Block(self.cypher))
-        w.format_runs(_paragraph)
-        # print and format the cypher
-
-        _paragraph = document.add_paragraph()
-        _paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.JUSTIFY
+        # These three attributes store `Block` objects. The head's
+        # ready-made `var_index` dict hands each position over in one
+        # lookup, where the old ternaries did a membership test plus a
+        # linear `list.index` scan per variable, per spectrum.
+        _var_index = self.formatter.head.var_index
+        _i = _var_index.get('%n')
+        self.nuclide = self._spectrum_data[_i] if _i is not None else None
+        _i = _var_index.get('%s')
+        self.solvent = self._spectrum_data[_i] if _i is not None else None
+        _i = _var_index.get('%f')
+        self.frequency = self._spectrum_data[_i] if _i is not None else None
+
+    def to_xml(self, formatter=None):
+        """Render the spectrum into ready `<w:p>` XML elements (one for
+        the cypher, one for the spectrum itself) using JUSTIFY alignment.
+        The paragraphs are built detached from any document, so the
+        caller can splice them into a document body in one batch instead
+        of going through `document.add_paragraph` and its bookkeeping
+        for every paragraph.
+
+        :return: a list of two `<w:p>` lxml elements."""
+
+        _segments = []
+        w.collect_runs(_segments, Block(self.cypher))
+        _elements = [w.paragraph_from_segments(_segments)]
+        # collect and render the cypher
+
         if formatter is None:
             formatter = self.formatter
         # Ready to print the spectrum itself. If no formatter is given,
         # use the formatter used to read the spectrum.
 
-        w.build_runs(self, _paragraph, formatter.head)
-        for signal in self.signals:
-            w.build_runs(self, _paragraph, formatter.hypotheses, signal)
-            if self.signals[-1] != signal:
-                w.print_runs(_paragraph, formatter.delimiter)
+        _segments = []
+        w.build_runs(self, _segments, formatter.head)
+        _last = len(self.signals) - 1
+        for _i, signal in enumerate(self.signals):
+            w.build_runs(self, _segments, formatter.hypotheses, signal)
+            if _i != _last:
+                w.collect_runs(_segments, formatter.delimiter)
+                # Every signal except the last is followed by the
+                # delimiter; comparing positions is free, where the old
+                # `self.signals[-1] != signal` compared objects on every
+                # iteration.
         if formatter.end:
-            w.print_runs(_paragraph, formatter.end)
-        w.format_runs(_paragraph)
-        # Print each signals, separating those with a given delimiter. Use
-        # the end symbol if one is provided. Use the same paragraph for
-        # printing.
+            w.collect_runs(_segments, formatter.end)
+        _elements.append(w.paragraph_from_segments(_segments))
+        return _elements
+        # Collect each signal, separating those with a given delimiter,
+        # and the end symbol if one is provided, into a flat segment
+        # list, then render the whole paragraph in one XML parse.
 
     def read(self):
         """Parse the spectrum text using a formatter, fill in
@@ -106,40 +123,43 @@ class Spectrum:
         Parse the head section of the spectrum using `self.formatter.head`.
         """
 
+        _pos = 0
+        # A single integer cursor into `self.text`. The old version cut
+        # the parsed portion off the front of `self.text` per constant,
+        # copying the whole remaining char list every time and making
+        # head parsing quadratic; the cursor just moves forward instead.
         for block in self.formatter.head.constants:
-            if block not in self.text:
-                raise InputError(f'"{block()}", given in the format '
+            _block_str = block()
+            try:
+                _i = self.text.index(_block_str, _pos)
+            except ValueError:
+                raise InputError(f'"{_block_str}", given in the format '
                                  f'template, is never ecnountered in the '
                                  f'spectrum {self.cypher}')
                 # raise an InputError if the input is missing constant
                 # information given in the formatter.
-            _i = self.text.index(block)
-            # remember the position of the located blocks.
-            if self.text[:_i]:
-                _variable = self.text[:_i]
-                self._spectrum_data.append(Block(_variable))
-            # if there's anything prior to that position, it's an unparsed
-            # variable to be stored
-            _temp = self.text[_i + len(block()):]
-            self.text = _temp
-            # cut away the parsed portion of the text
+            if _i > _pos:
+                self._spectrum_data.append(self.text[_pos:_i])
+            # if there's anything between the cursor and the located
+            # block, it's an unparsed variable to be stored. The slice is
+            # already a fresh `Block`, no need to re-wrap it.
+            _pos = _i + len(_block_str)
+            # step the cursor over the parsed constant.
+        self.text = self.text[_pos:]
+        # cut away everything parsed in one go.
 
     def parse_signals(self):
         """
         Parse the signal section of the spectrum.
         :return: None.
         """
-        _delimiter = self.formatter.delimiter
-        # _delimiter is the actual delimiter specified by the user.
-        delimiter = self.formatter.signals()[-1]() + _delimiter \
-            if not self.formatter.signals()[-1].variable and \
-               not self.formatter.signals()[-1].optional else _delimiter
-        # if the final character in repeats is not optional or variable,
-        # that's a good cue for splitting. `self.formatter.signals` is called
-        # here so as to make it subscriptible.
-
-        # delimiter = _delimiter # a line I like to use to trigger
-        # `self.complex_parse_into_signals(delimiter)`
+        delimiter = self.formatter.split_delimiter
+        # The delimiter to split on, with the closing constant of a
+        # repeat already glued on when it makes a good cue; precomputed
+        # once per formatter rather than per spectrum.
+
+        # delimiter = self.formatter.delimiter # a line I like to use to
+        # trigger `self.complex_parse_into_signals(delimiter)`
         # if delimiter() not in self.text():
         #     raise InputError(f'"{delimiter()}" не встречается в тексте '
         #                      f'сигнала, поэтому невозможно считать спектр')
@@ -148,19 +168,24 @@ class Spectrum:
         # Currently disabled, since cases with only one signal raise
         # this error.
 
-        if delimiter() not in ''.join(self.formatter.hypotheses()[0][0].str):
+        if not self.formatter.delimiter_in_h0:
             _signals = self.text.split(delimiter)
+            _end_str = self.formatter.end()
+            _sig_section = self.formatter.signals
+            _tail = ''
+            if _sig_section.constants and _sig_section.section and \
+                    not _sig_section.constants[-1].optional and \
+                    _sig_section.constants[-1] == _sig_section.section[-1]:
+                _tail = _sig_section.constants_str[-1]
+            # Everything that doesn't depend on the individual signal —
+            # the end text and the closing constant to restore, if any —
+            # is settled before the loop instead of being re-read from
+            # the formatter for every split signal.
             for i, signal in enumerate(_signals):
-                _signals[i].pop() if signal[-1]() in self.formatter.end() \
-                    else None
-                if self.formatter.signals.constants and \
-                        self.formatter.signals.section:
-                    _signals[i] += self.formatter.signals.constants_str[-1] if \
-                        not self.formatter.signals.constants[-1].optional and \
-                        self.formatter.signals.constants[-1] == \
-                        self.formatter.signals.section[-1] and \
-                        self.formatter.signals.constants_str[-1] != signal[-1]() \
-                        else ''
+                if signal[-1]() in _end_str:
+                    _signals[i].pop()
+                if _tail and _tail != signal[-1]():
+                    _signals[i] += _tail
             # If the fullest hypothesis (`self.formatter.hypotheses()[0][0]`)
             # does not contain the delimiter, then it's unique to margins
             # between each signal. We can simply split the text Block into
@@ -176,10 +201,15 @@ class Spectrum:
             _signals = self.complex_parse_into_signals(delimiter)
             # If the easy parsing can't be performed, do the hard-guessing.
 
+        sole_hypothesis = self.formatter.sole_hypothesis
+        # When the template has no optional pieces there's exactly one
+        # hypothesis any signal can match, pre-resolved on the formatter;
+        # the per-signal matching scan is skipped entirely then.
+
         for signal in _signals:
             #print(f"{signal()}") # uncomment this to find irregularities in
             # text format
-            hypothesis = self.match_hypothesis(signal)
+            hypothesis = sole_hypothesis or self.match_hypothesis(signal)
             self.signals.append(self.parse_signal(signal, hypothesis))
             # For each signal, match it with its best-fitting hypothesis and
             # use that to parse it.
@@ -239,63 +269,77 @@ class Spectrum:
             # call it a day.
 
             else:
-                while l_anchor in self.text and r_anchor in self.text \
-                        and delimiter in self.text:
+                _l_str, _r_str, _d_str = l_anchor(), r_anchor(), delimiter()
+                _use_r_for_l = l_anchor == delimiter
+                _use_l_for_r = r_anchor == delimiter
+                # The anchors don't change inside the loop, so their
+                # texts and their overlap with the delimiter are settled
+                # here once rather than per signal.
+
+                while True:
+                    _text_str = self.text()
+                    _l_i = _text_str.find(_l_str)
+                    _r_i = _text_str.find(_r_str)
+                    _d_i = _text_str.find(_d_str)
+                    if _l_i < 0 or _r_i < 0 or _d_i < 0:
+                        break
                     # Keep this loop going as long as the three identifiers
                     # can be located. Once they can't, end the loop, and that
                     # will result in the auto-splitting of what's left as used
-                    # above.
+                    # above. Each identifier is located with one `find` on
+                    # the cached string, and the positions feed everything
+                    # below — the old version re-ran a containment scan
+                    # plus an `index` scan per identifier per signal.
 
-                    text_ = self.text[:] # temp copy of self.text Block.
-                    _l_anch_index = self.text.index(l_anchor) \
-                        if l_anchor != delimiter else \
-                        self.text.index(r_anchor)
+                    _prev_len = len(self.text)
+                    _l_anch_index = _r_i if _use_r_for_l else _l_i
                     # use `l_anchor` as an actual left anchor as long as
                     # it's not the same as the delimiter.
 
-                    _r_anch_index = self.text.index(r_anchor) \
-                        if r_anchor != delimiter else \
-                        self.text.index(l_anchor)
+                    _r_anch_index = _l_i if _use_l_for_r else _r_i
                     # use `r_anchor` as an actual right anchor as long as
                     # it's not the same as the delimiter.
 
                     # Idea: Maybe think of a strategy if both `l_anchor` and
                     # `r_anchor` fail?
 
-                    if self.text.index(delimiter) < _l_anch_index:
-                        _l_index = len(self.text) - self.text[::-1].index(
-                            delimiter, self.text[::-1].index(l_anchor))
+                    if _d_i < _l_anch_index:
+                        _anchor_pos = self.text.rindex(l_anchor)
+                        _l_index = self.text.rindex(delimiter, 0,
+                            _anchor_pos + len(delimiter)) + len(delimiter)
                         # if the delimiter is encountered before the anchor,
                         # then the left margin is the end of the first
                         # delimiter before the anchor (which is not
                         # necessarily the same as the first delimiter in
-                        # `self.text`)
+                        # `self.text`). `rindex` scans in place; the old
+                        # `[::-1]` route built two fully reversed copies of
+                        # the Block per iteration just to search them.
                     else:
                         _l_index = None
                         # Otherwise `_l_index` is the first element.
 
-                    if delimiter in \
-                            self.text[_r_anch_index + len(r_anchor):]:
-                        _r_index = self.text.index(delimiter,
-                            _r_anch_index + len(r_anchor))
-                        # If there're delimiters after the right anchor,
-                        # then the first of those delimiters will be use as
-                        # right index.
-                    else:
-                        _r_index = None
-                        # Otherwise the slicing will be made up until the
-                        # end of list.
+                    _after_r = _text_str.find(_d_str,
+                        _r_anch_index + len(r_anchor))
+                    _r_index = _after_r if _after_r >= 0 else None
+                    # If there're delimiters after the right anchor, the
+                    # first of those is the right index; otherwise the
+                    # slicing will be made up until the end of list. One
+                    # bounded `find` settles both, where this used to
+                    # slice a copy of the tail just to test membership.
 
                     _signals.append(self.text[_l_index:_r_index])
                     self.text = self.text[len(_signals[-1]) + len(delimiter):]
                     # Append the slice, and extract it from `self.text`.
 
-                    if self.text == text_:
+                    if len(self.text) == _prev_len:
                         finished = True
                         break
                     # If by this time the strategy is not working,
                     # then there's nothing to be done and the function
-                    # should conclude.
+                    # should conclude. Clipping only ever shortens
+                    # `self.text` from the front, so an unchanged length
+                    # means an unchanged text — no need for the full copy
+                    # the old comparison kept around.
 
         return _signals
 
@@ -314,60 +358,80 @@ class Spectrum:
         hypothesis.
         """
 
+        signal_str = signal()
+        _pos_cache = {}
+        # One list of match offsets per distinct constant text, computed
+        # on the first hypothesis that asks for it and reused by every
+        # other hypothesis probed against this signal. Hypotheses of the
+        # same length share most of their constants, so the old
+        # per-hypothesis `count`/`index`/slice cycle rescanned the same
+        # signal over and over.
+
         for hypothesis_set in self.formatter.hypotheses():
-            scores = []
-            # scores are relevant only within a set of hypotheses of the same
-            # length
+            best_score = -1
+            best_hypothesis = None
+            # The lowest-penalty hypothesis seen so far; scores are
+            # relevant only within a set of hypotheses of the same length.
 
             for hypothesis in hypothesis_set:
                 if not hypothesis.constants: # If the entire hypothesis is
                     # just one variable, that's the correct hypothesis
                     return hypothesis
-                score = 0
                 next_ = False # trigger to tell us that the hypothesis is wrong
                 counts = []
-                _temp = signal[:]
+                _cursor = 0
                 for block in hypothesis.constants_str:
-                    count = _temp.count(block)
+                    positions = _pos_cache.get(block)
+                    if positions is None:
+                        positions = []
+                        _i = signal_str.find(block)
+                        while _i >= 0:
+                            positions.append(_i)
+                            _i = signal_str.find(block, _i + len(block))
+                        _pos_cache[block] = positions
+                        # A single left-to-right scan, stepping over each
+                        # match the way `str.count` does.
+                    _k = bisect_left(positions, _cursor)
+                    count = len(positions) - _k
+                    # The occurrences at or past the cursor, found by
+                    # binary search instead of recounting the clipped
+                    # signal.
                     if count == 0: next_ = True; break
                     # if a Block from the hypothesis can't be found,
                     # the hypothesis is false, stop checking Blocks.
                     counts.append(count)
-                    _temp = _temp[_temp.index(block):]
-                    # otherwise remember the count and clip the signal
+                    _cursor = positions[_k]
+                    # otherwise remember the count and advance the cursor
+                    # to the first occurrence, as the old slicing did
 
                 if next_:
-                    scores.append(-1)
                     continue
-                    # If the hypothesis is wrong, record its count as -1 and
-                    # move on to the next hypothesis
-                if set(counts) == {1}:
+                    # If the hypothesis is wrong, just move on to the
+                    # next hypothesis
+                _total = sum(counts)
+                if _total == len(counts):
                     return hypothesis
                     # If a hypothesis has exactly one of each `Block`,
-                    # that's a bingo.
-                for count in counts:
-                    score += count - 1
-                    scores.append(score)
-                    # Else score a penalty point for each extra encounter of
-                    # a `Block` and write that to scores
-
-            # Next evaluate each of the scores. First of all, negative
-            # scores are scores of false hypotheses, we should not include
-            # those. Then find the minimal score. The first hypothesis with
-            # that score will be the working one.
-            _scores = []
-            for score in scores:
-                if score >= 0:
-                    _scores.append(score)
-            if not _scores:
-                continue
-            # If all hypotheses of current length have been neglected,
-            # the `_scores` list will be empty, we should consider shorter
-            # hypotheses.
-
-            _hypothesis = hypothesis_set[scores.index(min(_scores))]
-            return _hypothesis
-            # Choose the hypothesis with the minimal penalty score.
+                    # that's a bingo. Every count here is at least 1 (a
+                    # zero bailed out above), so all-ones is equivalent
+                    # to the sum matching the length — no need to build
+                    # a set just for this test.
+                score = _total - len(counts)
+                if best_hypothesis is None or score < best_score:
+                    best_score = score
+                    best_hypothesis = hypothesis
+                # Else the score is a penalty point for each extra
+                # encounter of a `Block`, and the running best is tracked
+                # on the spot — no scores list to filter, min() and
+                # index() over afterwards, and the winner is the
+                # hypothesis object itself rather than a position that
+                # had to stay aligned with the set.
+
+            if best_hypothesis is not None:
+                return best_hypothesis
+            # Choose the hypothesis with the minimal penalty score. If
+            # every hypothesis of the current length has been neglected,
+            # move on and consider shorter ones.
 
         raise InputError('the text cannot be matched with the input format '
                          'template')
@@ -394,21 +458,22 @@ class Spectrum:
             temp_block_i = signal.index(block)
             # Find its place within the signal
 
-            # If that's not the final block, then make a slice of the signal
-            # up until the first occurrence of the next `Block` after
-            # current block. Then find the last occurrence of the current
-            # `Block` within the slice. In other words, when there're
-            # several occurrences of the same block, assume that the latest
-            # before the next sort of `Block` is the one to use.
+            # If that's not the final block, then bound the search at the
+            # first occurrence of the next `Block` after the current
+            # block. Then find the last occurrence of the current `Block`
+            # before that bound. In other words, when there're several
+            # occurrences of the same block, assume that the latest
+            # before the next sort of `Block` is the one to use. `rindex`
+            # does the backwards search in place — this used to copy the
+            # bounded slice, reverse it, and search it for a reversed
+            # copy of the block.
             if i < len(hypothesis.constants_str) - 1:
-                sliced_list = signal[:signal.index(
-                    hypothesis.constants_str[i+1], temp_block_i + len(block))]
+                _end = signal.index(hypothesis.constants_str[i+1],
+                    temp_block_i + len(block))
             else:
-                sliced_list = signal[:]
+                _end = len(signal)
 
-            sliced_list.reverse()
-            block_i = sliced_list.index(block[::-1])
-            true_block_i = len(sliced_list) - block_i - len(block)
+            true_block_i = signal.rindex(block, 0, _end)
             working_slice = signal[:true_block_i]
             working_slice.lstrip()
 
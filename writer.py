@@ -3,21 +3,49 @@ This module is for writing down processed spectra into a .docx files with
 correct styling.
 """
 
+from xml.sax.saxutils import escape
 from exceptions import FormatError
-from docx.shared import Pt
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
 
 
-def build_runs(spectrum, paragraph, formatter, signal=None):
+_W_NSDECLS = nsdecls('w')
+
+_FONT_PROPS_XML = ('<w:rFonts w:ascii="Times New Roman" '
+                   'w:hAnsi="Times New Roman"/>')
+_SZ_XML = '<w:sz w:val="28"/>'
+# The run properties every written run receives: Times New Roman at
+# 14 pt (`w:sz` counts half-points), as ready-made XML snippets the run
+# markup is assembled from.
+
+_match_cache = {}
+# Output hypotheses already matched, keyed by the output `Hypotheses`
+# object and the variable set of the signal being written. The signal
+# hypotheses the keys reference live as long as their formatter, so the
+# cache never goes stale within a run.
+
+
+def build_runs(spectrum, segments, formatter, signal=None):
     """Since text styling is done with `Run` objects in .docx, assemble
-    those from each indivifual block in the formatter"""
+    the (text, bits) segments for those from each indivifual block in
+    the formatter"""
 
     def match_hypothesis(signal, formatter):
         """Find the hypothesis that shares the same set of variables as the
         currently written `Section`"""
 
+        _key = (id(formatter), signal.hypothesis.contains)
+        _match = _match_cache.get(_key)
+        if _match is not None:
+            return _match
+        # Signals of the same shape (same variable set) always match the
+        # same output hypothesis, so the subset walk below runs once per
+        # shape per output format rather than once per signal.
+
         for hypothesis_set in formatter.hypotheses:
             for hypothesis in hypothesis_set:
                 if hypothesis.contains <= signal.hypothesis.contains:
+                    _match_cache[_key] = hypothesis
                     return hypothesis
         raise FormatError('the output format requires data the input spectra'
                           'do not provide')
@@ -49,57 +77,86 @@ def build_runs(spectrum, paragraph, formatter, signal=None):
             # Looks like it's a more preferable error message than the
             # simple `your output format is too excessive`.
 
-            print_runs(paragraph, variable)
-            # Print the variable using the styling stored in the spectrum.
+            collect_runs(segments, variable)
+            # Collect the variable using the styling stored in the
+            # spectrum.
 
         else:
 
-            print_runs(paragraph, block)
-            # Print the constant block using the styling provided by the
-            # output format.
+            collect_runs(segments, block)
+            # Collect the constant block using the styling provided by
+            # the output format.
 
 
-def print_runs(paragraph, block):
+def collect_runs(segments, block):
     """A function that checks whether a single block is to be written down
-    as just one or many `Run` objects"""
-
-    for i, char in enumerate(block):
-        if i == 0:
-            run = paragraph.add_run(char())
-            style_run(run, char)
-            # The first char within the block always initiates a new `Run`,
-            # and its styling is defined
-
-        elif char.bits != block[i-1].bits:
-            run = paragraph.add_run(char())
-            style_run(run, char)
-            # The same goes for a char whose styling doesn't match that of a
-            # previous char. Can't combine it with a previous `if`
-            # expression since this one requires there to be a previous char
-            # in the first place.
-
+    as just one or many `Run` objects: each stretch of identically styled
+    chars becomes one (text, bits) segment appended to `segments`."""
+
+    chars = block.chars
+    if not chars:
+        return
+    prev_char = chars[0]
+    buffer = [prev_char.str]
+    # Collect each stretch of identically styled chars in a plain string
+    # buffer and emit it as one segment.
+    for char in chars[1:]:
+        if char.bits is not prev_char.bits:
+            # `Char` interns its `bits` tuples, one shared object per
+            # distinct styling, so identity is equality here — and a
+            # pointer check beats comparing five elements per character.
+            segments.append((''.join(buffer), prev_char.bits))
+            # A char whose styling doesn't match that of the previous
+            # char concludes the current segment...
+            buffer = [char.str]
         else:
-            run.text += char()
-            # If the styling maintains, just add the char to the run.
-
-def style_run(run, char):
-    """Define the styling of a run from the styling of the first char in it."""
+            buffer.append(char.str)
+            # ...while one with the same styling just joins the segment.
+        prev_char = char
+    segments.append((''.join(buffer), prev_char.bits))
+    # The final segment is always left unflushed by the loop.
 
-    run.italic = char.bits[0]
-    run.bold = char.bits[1]
-    run.underline = char.bits[2]
-    run.font.subscript = char.bits[3]
-    run.font.superscript = char.bits[4]
 
-def format_runs(paragraph):
+def paragraph_from_segments(segments):
     """
-    Format a paragraph as Pt 14 Times New Roman.
-    Idea: maybe make it customizable by the user?
+    Build one justified `<w:p>` paragraph element out of (text, bits)
+    segments, one `<w:r>` per segment, as a single XML string parsed in
+    one go. The old path went through python-docx's `add_run` and the
+    `.font`/`.italic`/... property layer, mutating the lxml tree element
+    by element and attribute by attribute for every run; one `parse_xml`
+    for the whole paragraph leaves all of that to the C parser.
+
+    The styling markup mirrors what the property setters used to
+    produce: toggle properties are absent when inherited (`None`),
+    empty when on, `w:val="0"` when explicitly off; underline is
+    'single'/'none'; a `w:vertAlign` appears only where the old
+    subscript-then-superscript assignment pair would have left one.
+
+    Idea: maybe make the font customizable by the user?
     """
 
-    for run in paragraph.runs:
-        run.font.name = 'Times New Roman'
-        run.font.size = Pt(14)
+    runs = []
+    for text, bits in segments:
+        italic, bold, underline, subscript, superscript = bits
+        props = [_FONT_PROPS_XML]
+        if bold is not None:
+            props.append('<w:b/>' if bold else '<w:b w:val="0"/>')
+        if italic is not None:
+            props.append('<w:i/>' if italic else '<w:i w:val="0"/>')
+        props.append(_SZ_XML)
+        if underline is not None:
+            props.append('<w:u w:val="single"/>' if underline
+                         else '<w:u w:val="none"/>')
+        if superscript:
+            props.append('<w:vertAlign w:val="superscript"/>')
+        elif subscript and superscript is False:
+            props.append('<w:vertAlign w:val="subscript"/>')
+        # The property order follows the `w:rPr` content model.
+        runs.append(
+            '<w:r><w:rPr>%s</w:rPr><w:t xml:space="preserve">%s</w:t></w:r>'
+            % (''.join(props), escape(text)))
+    return parse_xml('<w:p %s><w:pPr><w:jc w:val="both"/></w:pPr>%s</w:p>'
+                     % (_W_NSDECLS, ''.join(runs)))
 
 
 def match_variable(spectrum, block, signal=None):
@@ -117,22 +174,32 @@ def match_variable(spectrum, block, signal=None):
     the `block` special notation.
     """
 
-    if "%n" in block:
-        return spectrum.nuclide
-    if "%s" in block:
-        return spectrum.solvent
-    if "%f" in block:
-        return spectrum.frequency
-    if not signal:
+    _text = block()
+    _i = _text.index('%')
+    key = _text[_i:_i + 2]
+    # The notation is always '%' plus one letter; slicing it out and
+    # hitting the dispatch table once replaces the old ladder of up to
+    # eight substring scans per variable per signal.
+    if not signal and key not in _HEAD_KEYS:
         raise FormatError(f'"{block()}" cannot be used in the head of the '
                           f'spectrum!')
-    if "%c" in block:
-        return signal.chemshift
-    if "%i" in block:
-        return signal.integral
-    if "%m" in block:
-        return signal.multiplicity
-    if "%j" in block:
-        return signal.j_values
-    if "%a" in block:
-        return signal.assignment
\ No newline at end of file
+    return _VAR_GETTERS[key](spectrum, signal)
+
+
+_VAR_GETTERS = {
+    '%n': lambda spectrum, signal: spectrum.nuclide,
+    '%s': lambda spectrum, signal: spectrum.solvent,
+    '%f': lambda spectrum, signal: spectrum.frequency,
+    '%c': lambda spectrum, signal: signal.chemshift,
+    '%i': lambda spectrum, signal: signal.integral,
+    '%m': lambda spectrum, signal: signal.multiplicity,
+    '%j': lambda spectrum, signal: signal.j_values,
+    '%a': lambda spectrum, signal: signal.assignment,
+}
+# Each known notation mapped straight onto the attribute it stands for.
+# The keys are guaranteed valid here: the `Formatter` rejects unknown
+# notations while parsing the template.
+
+_HEAD_KEYS = frozenset(('%n', '%s', '%f'))
+# The notations allowed in the head of the spectrum, where there's no
+# signal to read the rest from.
\ No newline at end of file